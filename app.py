@@ -1,5 +1,6 @@
 import base64
 import datetime
+import hashlib
 import io
 import math
 
@@ -15,6 +16,8 @@ import flask
 import pymongo
 import numpy as np
 
+from key_registry import register_keys
+
 # ---------------------------------------
 # -----------/ Functions /--------------
 # ---------------------------------------
@@ -66,7 +69,7 @@ def get_engines(df):
 
 # ------------/  /--------------
 # A function that grabs the SCP signal field and puts it in the MISC 5 column, and returns the number of number keys generated
-def get_scp_field(df, scp_names):
+def get_scp_field(df, scp_names, file_name=None, file_hash=None, section=None):
     
     df = df.replace(np.nan, '', regex=True)
     to_engine = df.columns.get_loc("TO ENGINE")
@@ -76,6 +79,9 @@ def get_scp_field(df, scp_names):
     equation = df.columns.get_loc("EQUATION")
     
     scp_lines = []
+
+    # Keys to be recorded in the key registry as (key, row, engine, direction), where row is the dataframe index of the line
+    registry_rows = []
     
     key_count = 0 
     # Iterate over the rows
@@ -91,6 +97,7 @@ def get_scp_field(df, scp_names):
                 
                 scp_flag = True
                 scp_lines.append(strip_scp(str(df.iloc[i, to_symbol])))
+                registry_rows.append((scp_lines[-1], int(df.index[i]), engine, "TO"))
                 key_count += 1
             
             # If the from engine is an SCP, get the concatenation of the from symbol and equation field
@@ -98,6 +105,7 @@ def get_scp_field(df, scp_names):
 
                 scp_flag = True
                 scp_lines.append(strip_scp(str(df.iloc[i, from_symbol]) + str(df.iloc[i, equation])))
+                registry_rows.append((scp_lines[-1], int(df.index[i]), engine, "FROM"))
                 key_count += 1
             
         if scp_flag==False:
@@ -105,6 +113,15 @@ def get_scp_field(df, scp_names):
             scp_lines.append("")
         
     df["MISC5"] = scp_lines
+
+    # Record the keys in the project-wide key registry; a registry failure must not stop key generation
+    if file_name is not None and file_hash is not None and section is not None:
+
+        try:
+            register_keys(file_name, file_hash, section, registry_rows)
+
+        except Exception as e:
+            print(e)
     
             
     return df, key_count
@@ -422,6 +439,9 @@ app.layout = html.Div(children=[
         # Hidden div that stores the uploaded file name
         html.Div(id='upload-name', style={'display': 'none'}),
 
+        # Hidden div that stores a hash of the uploaded file contents, which records the file version in the key registry
+        html.Div(id='upload-hash', style={'display': 'none'}),
+
         # Hidden div that stores the uploaded file length
         html.Div(id='upload-length', style={'display': 'none'}),
 
@@ -475,7 +495,8 @@ def start_record(placeholder):
                 Output('file-title', "children"),
                 Output('upload-length', 'children'),
                 Output('upload-width', 'children'),
-                Output('upload-name', 'children')],
+                Output('upload-name', 'children'),
+                Output('upload-hash', 'children')],
               [Input('upload-data', 'contents')],
               [State('upload-data', 'filename'),
                State('upload-data', 'last_modified')])
@@ -490,6 +511,9 @@ def update_output(contents, filename, last_modified):
         # store the filename for record
         upload_name = filename
 
+        # store a hash of the file contents to record the file version in the key registry
+        upload_hash = hashlib.sha1(base64.b64decode(contents.split(',')[1])).hexdigest()
+
         # store the length of the file uploaded for record
         upload_length = len(upload_df)
 
@@ -526,7 +550,7 @@ def update_output(contents, filename, last_modified):
     
     except Exception as e:
         print(e)
-        return None,None,None,[],[],[html.Br(), html.H6("There Was An Error Processing The File!"), html.Br()], dash.no_update, dash.no_update, dash.no_update
+        return None,None,None,[],[],[html.Br(), html.H6("There Was An Error Processing The File!"), html.Br()], dash.no_update, dash.no_update, dash.no_update, dash.no_update
     
     if contents is not None:
     
@@ -538,7 +562,8 @@ def update_output(contents, filename, last_modified):
             html.H6(filename),
             upload_length,
             upload_width,
-            upload_name)
+            upload_name,
+            upload_hash)
     
     else:
         return (upload_df.to_json(date_format='iso', orient='split'),
@@ -549,6 +574,7 @@ def update_output(contents, filename, last_modified):
         html.H6(filename),
         dash.no_update,
         dash.no_update,
+        dash.no_update,
         dash.no_update)
             
 
@@ -560,9 +586,11 @@ def update_output(contents, filename, last_modified):
                 Output('download-keys', 'children')],
               [Input('fit-dropdown', 'value')], 
               [State('new-a-xref-csv', 'children'),
-              State('new-d-xref-csv', 'children')]
+              State('new-d-xref-csv', 'children'),
+              State('upload-name', 'children'),
+              State('upload-hash', 'children')]
               )
-def update_tables(selection, a_jsonified, d_jsonified):
+def update_tables(selection, a_jsonified, d_jsonified, upload_name, upload_hash):
     
     if (a_jsonified is not None and d_jsonified is not None):
 
@@ -570,9 +598,10 @@ def update_tables(selection, a_jsonified, d_jsonified):
         a_df = pd.read_json(a_jsonified, orient='split')
         d_df = pd.read_json(d_jsonified, orient='split')
 
-        # Add the SCP to MISC 5
-        a_df, a_key_count = get_scp_field(a_df, selection)
-        d_df, d_key_count = get_scp_field(d_df, selection)
+        # Add the SCP to MISC 5, and record the keys in the key registry
+        # The example data has no upload name, so it is not recorded
+        a_df, a_key_count = get_scp_field(a_df, selection, upload_name, upload_hash, "analog")
+        d_df, d_key_count = get_scp_field(d_df, selection, upload_name, upload_hash, "digital")
         
         # Show the user the first five rows of selected columns of the df
         a_view_df = a_df.loc[a_df["MISC5"] != ""][["#TYPE", "TO ENGINE", "TO SYMBOL", "FROM ENGINE", "FROM SYMBOL", "EQUATION", "MISC5"]].iloc[:5]
@@ -0,0 +1,155 @@
+import argparse
+import os
+import sqlite3
+
+import pandas as pd
+
+# ---------------------------------------
+# -----------/ Key Registry /------------
+# ---------------------------------------
+
+# The local key registry records every SCP key generated across the project
+# Point XREF_KEY_REGISTRY at persistent storage; the default is relative to the working directory
+registry_path = os.environ.get("XREF_KEY_REGISTRY", "key_registry.db")
+
+# ------------/  /--------------
+# A function which takes in an SCP key and returns the compound (everything left of the colon)
+def get_compound(scp_key):
+
+    return scp_key.split(":", 1)[0]
+
+# ------------/  /--------------
+# A function which opens a connection to the key registry, creating the table and indexes if needed
+def registry_connect(path=None):
+
+    # Wait for other workers to finish writing instead of failing straight away
+    conn = sqlite3.connect(path or registry_path, timeout=30)
+
+    # WAL lets lookups run while a large bulk insert is in progress
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    conn.execute("""CREATE TABLE IF NOT EXISTS scp_keys (
+                        key TEXT NOT NULL,
+                        compound TEXT NOT NULL,
+                        file TEXT NOT NULL,
+                        file_hash TEXT NOT NULL,
+                        section TEXT NOT NULL,
+                        row INTEGER NOT NULL,
+                        engine TEXT NOT NULL,
+                        direction TEXT NOT NULL)""")
+
+    # The engine column has few distinct values, so it leads only the engine-only index
+    # and trails the key and compound indexes used for combined lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scp_keys_key_engine ON scp_keys (key, engine)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scp_keys_compound_engine ON scp_keys (compound, engine)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scp_keys_engine ON scp_keys (engine)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scp_keys_file_section ON scp_keys (file, section)")
+
+    return conn
+
+# ------------/  /--------------
+# A function which bulk inserts the keys of one section (analog or digital) of a xref file into the registry
+# A file is identified by its name. Keys previously recorded for the same file and section are replaced, so the
+# registry holds the keys from the latest upload and engine selection for each file. The hash records which version they came from
+def register_keys(file_name, file_hash, section, registry_rows, path=None):
+
+    conn = registry_connect(path)
+
+    try:
+        # One transaction for the whole section
+        with conn:
+            conn.execute("DELETE FROM scp_keys WHERE file = ? AND section = ?", (file_name, section))
+            conn.executemany("INSERT INTO scp_keys (key, compound, file, file_hash, section, row, engine, direction) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             ((key, get_compound(key), file_name, file_hash, section, row, engine, direction)
+                              for key, row, engine, direction in registry_rows
+                              if key != ""))
+
+        # Keep the query planner statistics current as the registry grows
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+
+# ------------/  /--------------
+# A function which deletes every key recorded for a file, and returns the number of rows deleted
+def forget_file(file_name, path=None):
+
+    conn = registry_connect(path)
+
+    try:
+        with conn:
+            deleted = conn.execute("DELETE FROM scp_keys WHERE file = ?", (file_name,)).rowcount
+    finally:
+        conn.close()
+
+    return deleted
+
+# ------------/  /--------------
+# A function which returns a dataframe of the registry rows matching a key, compound and/or engine
+def lookup_keys(key=None, compound=None, engine=None, path=None):
+
+    clauses = []
+    params = []
+
+    for column, value in (("key", key), ("compound", compound), ("engine", engine)):
+
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+
+    query = "SELECT key, compound, file, file_hash, section, row, engine, direction FROM scp_keys"
+
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+
+    query += " ORDER BY file, section, row"
+
+    conn = registry_connect(path)
+
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+# ------------/  /--------------
+# A function which returns a dataframe of every registry row whose key is used more than once across the project,
+# with the number of uses of the key, so the report shows each file, section and row where the duplicates are
+def key_collisions(path=None):
+
+    query = """SELECT s.key, d.uses, s.file, s.file_hash, s.section, s.row, s.engine, s.direction
+               FROM scp_keys AS s
+               JOIN (SELECT key, COUNT(*) AS uses
+                     FROM scp_keys
+                     GROUP BY key
+                     HAVING COUNT(*) > 1) AS d
+               ON s.key = d.key
+               ORDER BY d.uses DESC, s.key, s.file, s.section, s.row"""
+
+    conn = registry_connect(path)
+
+    try:
+        return pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+
+
+# ---------------------------------------
+# -----------/ Command Line /------------
+# ---------------------------------------
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description="Query the SCP key registry")
+    parser.add_argument("--key", help="SCP key, e.g. 1TC:B17.OUT")
+    parser.add_argument("--compound", help="SCP compound, e.g. 1TC")
+    parser.add_argument("--engine", help="SCP engine name")
+    parser.add_argument("--collisions", action="store_true", help="list every row of keys used more than once")
+    parser.add_argument("--forget", metavar="FILE", help="delete every key recorded for FILE")
+    parser.add_argument("--db", help="registry path (defaults to XREF_KEY_REGISTRY or key_registry.db)")
+    args = parser.parse_args()
+
+    if args.forget:
+        print(f"{forget_file(args.forget, args.db)} keys deleted for {args.forget}")
+    elif args.collisions:
+        print(key_collisions(args.db).to_string(index=False))
+    else:
+        print(lookup_keys(args.key, args.compound, args.engine, args.db).to_string(index=False))